@@ -4,23 +4,31 @@ Generates and manages WireGuard VPN access QR codes
 """
 
 import os
+import asyncio
+import bisect
 import subprocess
 import secrets
 import io
 import base64
+import functools
 import re
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional, Dict
+from typing import Optional, Dict, NamedTuple
 
-from fastapi import FastAPI, HTTPException, Depends, Request, Form
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, Depends, Request, Form, Query
+from fastapi.responses import HTMLResponse, JSONResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, BigInteger
+from sqlalchemy import event, inspect, text, func, select, update, bindparam, or_, Column, Integer, String, DateTime, Text, BigInteger
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.orm import load_only
 import qrcode
+from pyroute2 import WireGuard
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+from cryptography.hazmat.primitives.serialization import Encoding, PrivateFormat, PublicFormat, NoEncryption
 from pydantic import BaseModel
 
 
@@ -33,15 +41,41 @@ class Config:
     WG_ALLOWED_IPS = os.getenv("WG_ALLOWED_IPS", "0.0.0.0/0, ::/0")
     WG_SUBNET = os.getenv("WG_SUBNET", "10.10.0")
     WG_START_IP = int(os.getenv("WG_START_IP", "10"))
-    DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./wireguard_peers.db")
+    DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./wireguard_peers.db")
     APP_HOST = os.getenv("APP_HOST", "0.0.0.0")
     APP_PORT = int(os.getenv("APP_PORT", "6000"))
 
 config = Config()
 
 # Database setup
-engine = create_engine(config.DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def async_database_url(url: str) -> str:
+    """Plain sqlite:// URLs (older .env files) get the aiosqlite driver"""
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+
+engine = create_async_engine(async_database_url(config.DATABASE_URL))
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",        # readers don't block the writer
+    "PRAGMA synchronous=NORMAL",      # safe with WAL, one fsync per checkpoint instead of per commit
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=134217728",     # 128 MB
+    "PRAGMA cache_size=-20000",       # ~20 MB page cache
+)
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if engine.dialect.name != "sqlite":
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 
@@ -54,7 +88,7 @@ class Peer(Base):
     private_key = Column(String(64))
     preshared_key = Column(String(64), nullable=True)
     ip_address = Column(String(20), unique=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     last_used = Column(DateTime, nullable=True)
     usage_count = Column(Integer, default=0)
     is_active = Column(Integer, default=1)
@@ -63,13 +97,47 @@ class Peer(Base):
     total_rx = Column(BigInteger, default=0)  # Total received bytes
     total_tx = Column(BigInteger, default=0)  # Total sent bytes
     last_handshake = Column(DateTime, nullable=True)
+    # Cached QR code (base64 PNG); config_text never changes so neither does this,
+    # but it is re-encoded when QR_BOX_SIZE differs from the size it was cached at
+    qr_png_b64 = Column(Text, nullable=True)
+    qr_box_size = Column(Integer, nullable=True)
 
 
-Base.metadata.create_all(bind=engine)
+# Columns needed to list peers; leaves out keys, config_text and the cached QR code
+PEER_LIST_COLUMNS = load_only(
+    Peer.id, Peer.name, Peer.ip_address, Peer.public_key, Peer.created_at,
+    Peer.last_used, Peer.usage_count, Peer.is_active, Peer.last_handshake
+)
+
+
+def migrate_schema(conn):
+    """Add columns and indexes introduced after the database was created (create_all never alters tables)"""
+    table = Peer.__table__
+    inspector = inspect(conn)
+    
+    existing = {c["name"] for c in inspector.get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in existing:
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+    
+    existing_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing_indexes:
+            index.create(conn)
 
 
 # FastAPI app
-app = FastAPI(title="WireGuard QR Manager", version="1.1.0")
+# Every JSON handler returns ORJSONResponse itself: a plain dict would first go through
+# FastAPI's jsonable_encoder in Python, and orjson handles datetimes natively anyway
+app = FastAPI(title="WireGuard QR Manager", version="1.1.0", default_response_class=ORJSONResponse)
+
+
+@app.on_event("startup")
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(migrate_schema)
 
 templates_dir = Path(__file__).parent / "templates"
 templates_dir.mkdir(exist_ok=True)
@@ -80,113 +148,276 @@ static_dir.mkdir(exist_ok=True)
 app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-def get_wireguard_stats() -> Dict[str, dict]:
-    """Get current WireGuard peer stats from wg show"""
-    stats = {}
+async def run_command(
+    args: list[str], input: Optional[str] = None, check: bool = False, timeout: Optional[float] = None
+) -> subprocess.CompletedProcess:
+    """Async counterpart of subprocess.run(capture_output=True, text=True) that doesn't block the event loop"""
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
     try:
-        result = subprocess.run(
-            ["wg", "show", config.WG_INTERFACE, "dump"],
-            capture_output=True,
-            text=True,
-            timeout=5
+        stdout, stderr = await asyncio.wait_for(
+            proc.communicate(input.encode() if input is not None else None), timeout
         )
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise subprocess.TimeoutExpired(args, timeout)
+    
+    result = subprocess.CompletedProcess(args, proc.returncode, stdout.decode(), stderr.decode())
+    if check:
+        result.check_returncode()
+    return result
+
+
+class PeerStat(NamedTuple):
+    """Live counters for one peer, as reported by wg show"""
+    rx_bytes: int
+    tx_bytes: int
+    latest_handshake_ts: int  # epoch seconds, 0 if never
+    is_connected: bool
+
+
+# Stats for peers missing from wg show
+EMPTY_STAT = PeerStat(0, 0, 0, False)
+# A peer counts as connected if its last handshake is newer than this (~2 min)
+CONNECTED_TIMEOUT = 130  # seconds
+
+
+def peer_stat(rx_bytes: int, tx_bytes: int, latest_handshake_ts: int, now_ts: float) -> PeerStat:
+    is_connected = latest_handshake_ts > 0 and (now_ts - latest_handshake_ts) < CONNECTED_TIMEOUT
+    return PeerStat(rx_bytes, tx_bytes, latest_handshake_ts, is_connected)
+
+# Live stats are refreshed by a background task; handlers only read this snapshot.
+# It is replaced wholesale on every poll, never mutated in place.
+STATS_POLL_INTERVAL = 2  # seconds
+WG_STATS_SNAPSHOT: Dict[str, PeerStat] = {}
+HANDSHAKE_SAVE_INTERVAL = 60  # seconds
+
+
+async def save_handshakes(stats: Dict[str, PeerStat]):
+    """Persist newer handshakes so they outlive a WireGuard restart, in one bulk UPDATE"""
+    rows = [
+        {'pk': public_key, 'hs': handshake_datetime(s.latest_handshake_ts)}
+        for public_key, s in stats.items() if s.latest_handshake_ts
+    ]
+    if not rows:
+        return
+    
+    peers = Peer.__table__
+    stmt = (
+        update(peers)
+        .where(peers.c.public_key == bindparam('pk'))
+        .where(or_(peers.c.last_handshake.is_(None), peers.c.last_handshake < bindparam('hs')))
+        .values(last_handshake=bindparam('hs'))
+    )
+    async with SessionLocal() as db:
+        await db.execute(stmt, rows)
+        await db.commit()
+
+
+async def _stats_poller():
+    global WG_STATS_SNAPSHOT
+    last_saved = 0.0
+    failing = False
+    while True:
+        # Log only when reads start or stop failing, not on every poll
+        try:
+            WG_STATS_SNAPSHOT = await read_wireguard_stats()
+            if failing:
+                failing = False
+                print("WireGuard stats available again")
+        except Exception as e:
+            WG_STATS_SNAPSHOT = {}
+            if not failing:
+                failing = True
+                print(f"Error getting WireGuard stats: {e}")
         
-        if result.returncode != 0:
-            return stats
+        if time.monotonic() - last_saved >= HANDSHAKE_SAVE_INTERVAL:
+            last_saved = time.monotonic()
+            try:
+                await save_handshakes(WG_STATS_SNAPSHOT)
+            except Exception as e:
+                print(f"Error saving handshakes: {e}")
         
-        lines = result.stdout.strip().split('\n')
-        # Skip first line (interface info)
-        for line in lines[1:]:
-            parts = line.split('\t')
-            if len(parts) >= 8:
-                public_key = parts[0]
-                # parts: pubkey, psk, endpoint, allowed-ips, latest-handshake, rx, tx, keepalive
-                latest_handshake = int(parts[4]) if parts[4] != '0' else 0
-                rx_bytes = int(parts[5]) if parts[5] else 0
-                tx_bytes = int(parts[6]) if parts[6] else 0
-                
-                stats[public_key] = {
-                    'latest_handshake': datetime.fromtimestamp(latest_handshake) if latest_handshake else None,
-                    'rx_bytes': rx_bytes,
-                    'tx_bytes': tx_bytes,
-                    'is_connected': latest_handshake > 0 and (datetime.now().timestamp() - latest_handshake) < 130  # ~2 min
-                }
+        await asyncio.sleep(STATS_POLL_INTERVAL)
+
+
+@app.on_event("startup")
+async def start_stats_poller():
+    app.state.stats_poller = asyncio.create_task(_stats_poller())
+
+
+@app.on_event("shutdown")
+async def stop_stats_poller():
+    app.state.stats_poller.cancel()
+    try:
+        await app.state.stats_poller
+    except asyncio.CancelledError:
+        pass
+
+
+# Kernel WireGuard is driven over generic netlink; the wg tools are the fallback
+# when the netlink family isn't available (e.g. userspace wireguard-go)
+_netlink_supported = True
+
+
+def open_netlink() -> Optional[WireGuard]:
+    global _netlink_supported
+    if not _netlink_supported:
+        return None
+    try:
+        return WireGuard()
     except Exception as e:
-        print(f"Error getting WireGuard stats: {e}")
+        _netlink_supported = False
+        print(f"WireGuard netlink unavailable, falling back to wg tools: {e}")
+        return None
+
+
+def read_netlink_stats() -> Optional[Dict[str, PeerStat]]:
+    """Get current WireGuard peer stats over netlink, None if netlink is unavailable"""
+    wg = open_netlink()
+    if wg is None:
+        return None
+    
+    stats = {}
+    now_ts = time.time()
+    with wg:
+        for msg in wg.info(config.WG_INTERFACE):
+            for peer in msg.get_attr('WGDEVICE_A_PEERS') or ():
+                rx_bytes = peer.get_attr('WGPEER_A_RX_BYTES')
+                if rx_bytes is None:
+                    # Continuation of a peer split across messages (allowed IPs only)
+                    continue
+                handshake = peer.get_attr('WGPEER_A_LAST_HANDSHAKE_TIME')
+                public_key = peer.get_attr('WGPEER_A_PUBLIC_KEY').decode()
+                stats[public_key] = peer_stat(
+                    rx_bytes,
+                    peer.get_attr('WGPEER_A_TX_BYTES') or 0,
+                    handshake['tv_sec'] if handshake else 0,
+                    now_ts
+                )
+    return stats
+
+
+def set_netlink_peer(peer: dict) -> bool:
+    """Add, update or remove a peer over netlink, False if netlink is unavailable"""
+    wg = open_netlink()
+    if wg is None:
+        return False
+    with wg:
+        wg.set(config.WG_INTERFACE, peer=peer)
+    return True
+
+
+async def read_wireguard_stats() -> Dict[str, PeerStat]:
+    """Get current WireGuard peer stats; raises if neither netlink nor wg can read them"""
+    netlink_stats = await asyncio.to_thread(read_netlink_stats)
+    if netlink_stats is not None:
+        return netlink_stats
+    
+    result = await run_command(["wg", "show", config.WG_INTERFACE, "dump"], check=True, timeout=5)
+    
+    stats = {}
+    now_ts = time.time()
+    # Skip first line (interface info)
+    for line in result.stdout.splitlines()[1:]:
+        fields = line.split('\t', 8)
+        if len(fields) < 8:
+            continue
+        # fields: pubkey, psk, endpoint, allowed-ips, latest-handshake, rx, tx, keepalive
+        public_key, _, _, _, handshake, rx, tx, *_ = fields
+        # Epoch seconds, 0 if never; converted to datetime only where it is displayed
+        latest_handshake_ts = int(handshake or 0)
+        
+        stats[public_key] = peer_stat(int(rx or 0), int(tx or 0), latest_handshake_ts, now_ts)
     
     return stats
 
 
+# Formatted value of a zero counter
+ZERO_BYTES = "0 B"
+
+
+@functools.lru_cache(maxsize=4096)
+def handshake_datetime(ts: int) -> Optional[datetime]:
+    """Epoch handshake to datetime; memoized since a peer's handshake only moves every ~2 min"""
+    return datetime.fromtimestamp(ts) if ts else None
+
+
+# (divisor, format) per power of 1024
+BYTE_UNITS = [
+    (1, "{:.0f} B"),
+    (1024, "{:.1f} KB"),
+    (1024 ** 2, "{:.1f} MB"),
+    (1024 ** 3, "{:.2f} GB"),
+]
+
+
+@functools.lru_cache(maxsize=4096)
 def format_bytes(bytes_val: int) -> str:
     """Format bytes to human readable"""
-    if bytes_val < 1024:
-        return f"{bytes_val} B"
-    elif bytes_val < 1024 * 1024:
-        return f"{bytes_val / 1024:.1f} KB"
-    elif bytes_val < 1024 * 1024 * 1024:
-        return f"{bytes_val / (1024 * 1024):.1f} MB"
-    else:
-        return f"{bytes_val / (1024 * 1024 * 1024):.2f} GB"
+    if not bytes_val:
+        return ZERO_BYTES
+    divisor, fmt = BYTE_UNITS[min((bytes_val.bit_length() - 1) // 10, len(BYTE_UNITS) - 1)]
+    return fmt.format(bytes_val / divisor)
+
 
+# (age limit in seconds, label, unit in seconds) for time_ago, sorted by limit
+TIME_AGO_STEPS = [
+    (60, "Just now", 1),
+    (3600, "{}m ago", 60),
+    (86400, "{}h ago", 3600),
+    (7 * 86400, "{}d ago", 86400),
+]
+TIME_AGO_LIMITS = [limit for limit, _, _ in TIME_AGO_STEPS]
 
-def time_ago(dt: datetime) -> str:
-    """Format datetime as time ago string"""
-    if not dt:
+
+def time_ago(ts: float, now_ts: Optional[float] = None) -> str:
+    """Format epoch seconds as time ago string"""
+    if not ts:
         return "Never"
     
-    now = datetime.now()
-    diff = now - dt
+    diff = (now_ts or time.time()) - ts
+    step = bisect.bisect_right(TIME_AGO_LIMITS, diff)
+    if step == len(TIME_AGO_STEPS):
+        return datetime.fromtimestamp(ts).strftime("%b %d")
     
-    if diff.total_seconds() < 60:
-        return "Just now"
-    elif diff.total_seconds() < 3600:
-        mins = int(diff.total_seconds() / 60)
-        return f"{mins}m ago"
-    elif diff.total_seconds() < 86400:
-        hours = int(diff.total_seconds() / 3600)
-        return f"{hours}h ago"
-    elif diff.days < 7:
-        return f"{diff.days}d ago"
-    else:
-        return dt.strftime("%b %d")
+    _, label, unit = TIME_AGO_STEPS[step]
+    return label.format(int(diff // unit))
 
 
 def generate_wireguard_keys() -> tuple[str, str]:
-    try:
-        private_key = subprocess.run(
-            ["wg", "genkey"], capture_output=True, text=True, check=True
-        ).stdout.strip()
-        public_key = subprocess.run(
-            ["wg", "pubkey"], input=private_key, capture_output=True, text=True, check=True
-        ).stdout.strip()
-        return private_key, public_key
-    except FileNotFoundError:
-        raise HTTPException(status_code=500, detail="WireGuard tools not installed")
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=500, detail=f"Key generation failed: {e}")
+    """Generate a Curve25519 key pair in-process (same output as wg genkey | wg pubkey)"""
+    key = X25519PrivateKey.generate()
+    private_key = key.private_bytes(Encoding.Raw, PrivateFormat.Raw, NoEncryption())
+    public_key = key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+    return base64.b64encode(private_key).decode(), base64.b64encode(public_key).decode()
 
 
 def generate_preshared_key() -> str:
-    try:
-        return subprocess.run(
-            ["wg", "genpsk"], capture_output=True, text=True, check=True
-        ).stdout.strip()
-    except:
-        return base64.b64encode(secrets.token_bytes(32)).decode()
+    """Same as wg genpsk: 32 random bytes, base64 encoded"""
+    return base64.b64encode(secrets.token_bytes(32)).decode()
+
+
+# Serializes IP allocation + insert so concurrent creates can't pick the same address
+_ip_allocation_lock = asyncio.Lock()
 
 
-def get_next_ip(db: Session) -> str:
-    last_peer = db.query(Peer).order_by(Peer.id.desc()).first()
-    if last_peer:
-        last_octet = int(last_peer.ip_address.split('.')[-1].split('/')[0])
+async def get_next_ip(db: AsyncSession) -> str:
+    # Only fetch the newest peer's address, not the whole row
+    last_id = await db.scalar(select(func.max(Peer.id)))
+    last_ip = await db.scalar(select(Peer.ip_address).where(Peer.id == last_id)) if last_id else None
+    if last_ip:
+        last_octet = int(last_ip.split('.')[-1].split('/')[0])
         next_octet = last_octet + 1
     else:
         next_octet = config.WG_START_IP
@@ -215,36 +446,44 @@ def create_client_config(private_key: str, ip_address: str, preshared_key: Optio
     return "\n".join(config_lines)
 
 
-def add_peer_to_wireguard(public_key: str, ip_address: str, preshared_key: Optional[str] = None):
+async def add_peer_to_wireguard(public_key: str, ip_address: str, preshared_key: Optional[str] = None):
     try:
-        cmd = ["wg", "set", config.WG_INTERFACE, "peer", public_key, "allowed-ips", ip_address]
+        peer = {"public_key": public_key, "allowed_ips": [ip_address]}
         if preshared_key:
-            cmd.extend(["preshared-key", "/dev/stdin"])
-            subprocess.run(cmd, input=preshared_key, text=True, check=True, capture_output=True)
-        else:
-            subprocess.run(cmd, check=True, capture_output=True)
-        subprocess.run(["wg-quick", "save", config.WG_INTERFACE], capture_output=True)
+            peer["preshared_key"] = preshared_key
+        if not await asyncio.to_thread(set_netlink_peer, peer):
+            cmd = ["wg", "set", config.WG_INTERFACE, "peer", public_key, "allowed-ips", ip_address]
+            if preshared_key:
+                cmd.extend(["preshared-key", "/dev/stdin"])
+                await run_command(cmd, input=preshared_key, check=True)
+            else:
+                await run_command(cmd, check=True)
+        # Netlink changes are live but not persistent; save them to the interface config
+        await run_command(["wg-quick", "save", config.WG_INTERFACE])
         return True
     except Exception as e:
         print(f"Warning: Could not add peer: {e}")
         return False
 
 
-def remove_peer_from_wireguard(public_key: str):
+async def remove_peer_from_wireguard(public_key: str):
     try:
-        subprocess.run(
-            ["wg", "set", config.WG_INTERFACE, "peer", public_key, "remove"],
-            check=True, capture_output=True
-        )
-        subprocess.run(["wg-quick", "save", config.WG_INTERFACE], capture_output=True)
+        if not await asyncio.to_thread(set_netlink_peer, {"public_key": public_key, "remove": True}):
+            await run_command(["wg", "set", config.WG_INTERFACE, "peer", public_key, "remove"], check=True)
+        await run_command(["wg-quick", "save", config.WG_INTERFACE])
         return True
     except Exception as e:
         print(f"Warning: Could not remove peer: {e}")
         return False
 
 
+# Pixels per QR module: small enough to keep the cached PNG light, large enough
+# to scan without the page's image-rendering: pixelated upscaling
+QR_BOX_SIZE = 4
+
+
 def generate_qr_code(config_text: str) -> str:
-    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
+    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=QR_BOX_SIZE, border=4)
     qr.add_data(config_text)
     qr.make(fit=True)
     img = qr.make_image(fill_color="black", back_color="white")
@@ -256,54 +495,11 @@ def generate_qr_code(config_text: str) -> str:
 
 # Routes
 @app.get("/", response_class=HTMLResponse)
-async def index(request: Request, db: Session = Depends(get_db)):
-    peers = db.query(Peer).order_by(Peer.created_at.desc()).all()
-    wg_stats = get_wireguard_stats()
-    
-    # Enrich peers with live stats
-    connected_count = 0
-    peers_data = []
-    
-    for peer in peers:
-        stats = wg_stats.get(peer.public_key, {})
-        is_connected = stats.get('is_connected', False)
-        
-        if is_connected:
-            connected_count += 1
-        
-        # Update last_handshake in DB if we have new data
-        if stats.get('latest_handshake'):
-            peer.last_handshake = stats['latest_handshake']
-        
-        peer_data = {
-            'id': peer.id,
-            'name': peer.name,
-            'ip_address': peer.ip_address,
-            'created_at': peer.created_at,
-            'last_used': peer.last_used,
-            'usage_count': peer.usage_count,
-            'is_active': peer.is_active,
-            'public_key': peer.public_key,
-            # Live stats
-            'is_connected': is_connected,
-            'last_handshake': stats.get('latest_handshake') or peer.last_handshake,
-            'last_handshake_ago': time_ago(stats.get('latest_handshake') or peer.last_handshake),
-            'rx_bytes': stats.get('rx_bytes', 0),
-            'tx_bytes': stats.get('tx_bytes', 0),
-            'rx_formatted': format_bytes(stats.get('rx_bytes', 0)),
-            'tx_formatted': format_bytes(stats.get('tx_bytes', 0)),
-            'total_transfer': format_bytes(stats.get('rx_bytes', 0) + stats.get('tx_bytes', 0))
-        }
-        peers_data.append(peer_data)
-    
-    db.commit()
-    
+async def index(request: Request):
+    # Just the page shell; peers and live stats are loaded client-side from /api/peers and /api/stats
     return templates.TemplateResponse("index.html", {
         "request": request,
-        "peers": peers_data,
-        "connected_count": connected_count,
-        "server_configured": bool(config.WG_SERVER_PUBLIC_KEY),
-        "now": datetime.now().strftime("%H:%M:%S")
+        "server_configured": bool(config.WG_SERVER_PUBLIC_KEY)
     })
 
 
@@ -311,149 +507,183 @@ async def index(request: Request, db: Session = Depends(get_db)):
 async def create_peer(
     name: Optional[str] = Form(None),
     use_preshared_key: bool = Form(True),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if not config.WG_SERVER_PUBLIC_KEY:
         raise HTTPException(status_code=400, detail="Server not configured")
     
     private_key, public_key = generate_wireguard_keys()
     preshared_key = generate_preshared_key() if use_preshared_key else None
-    ip_address = get_next_ip(db)
-    config_text = create_client_config(private_key, ip_address, preshared_key)
     
-    peer = Peer(
-        name=name or f"Peer-{datetime.now().strftime('%Y%m%d-%H%M%S')}",
-        public_key=public_key,
-        private_key=private_key,
-        preshared_key=preshared_key,
-        ip_address=ip_address,
-        config_text=config_text
-    )
+    async with _ip_allocation_lock:
+        ip_address = await get_next_ip(db)
+        config_text = create_client_config(private_key, ip_address, preshared_key)
+        
+        peer = Peer(
+            name=name or f"Peer-{datetime.now().strftime('%Y%m%d-%H%M%S')}",
+            public_key=public_key,
+            private_key=private_key,
+            preshared_key=preshared_key,
+            ip_address=ip_address,
+            config_text=config_text
+        )
+        
+        db.add(peer)
+        await db.commit()
     
-    db.add(peer)
-    db.commit()
-    db.refresh(peer)
+    # Encode the QR outside the lock so concurrent creates only wait on IP selection + insert
+    peer.qr_png_b64 = await asyncio.to_thread(generate_qr_code, config_text)
+    peer.qr_box_size = QR_BOX_SIZE
+    await db.commit()
     
-    add_peer_to_wireguard(public_key, ip_address, preshared_key)
+    await add_peer_to_wireguard(public_key, ip_address, preshared_key)
     
-    return {"id": peer.id, "name": peer.name, "ip_address": peer.ip_address}
+    return ORJSONResponse({"id": peer.id, "name": peer.name, "ip_address": peer.ip_address})
 
 
 @app.get("/api/peers")
-async def list_peers(db: Session = Depends(get_db)):
-    peers = db.query(Peer).order_by(Peer.created_at.desc()).all()
-    wg_stats = get_wireguard_stats()
+async def list_peers(
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_db)
+):
+    # Newest first; walks the created_at index instead of sorting the whole table
+    peers = (await db.scalars(
+        select(Peer).options(PEER_LIST_COLUMNS).order_by(Peer.created_at.desc()).limit(limit).offset(offset)
+    )).all()
+    wg_stats = WG_STATS_SNAPSHOT
+    now_ts = time.time()
     
     result = []
     for p in peers:
-        stats = wg_stats.get(p.public_key, {})
+        stats = wg_stats.get(p.public_key, EMPTY_STAT)
+        # Fall back to the handshake saved by the stats poller
+        last_handshake_ts = stats.latest_handshake_ts or (p.last_handshake.timestamp() if p.last_handshake else 0)
         result.append({
             "id": p.id,
             "name": p.name,
             "ip_address": p.ip_address,
-            "created_at": p.created_at.isoformat(),
-            "last_used": p.last_used.isoformat() if p.last_used else None,
+            "created_at": p.created_at,
+            "last_used": p.last_used,
             "usage_count": p.usage_count,
             "is_active": bool(p.is_active),
-            "is_connected": stats.get('is_connected', False),
-            "last_handshake": stats.get('latest_handshake').isoformat() if stats.get('latest_handshake') else None,
-            "rx_bytes": stats.get('rx_bytes', 0),
-            "tx_bytes": stats.get('tx_bytes', 0)
+            "is_connected": stats.is_connected,
+            "last_handshake": handshake_datetime(stats.latest_handshake_ts),
+            "last_handshake_ago": time_ago(last_handshake_ts, now_ts),
+            "rx_bytes": stats.rx_bytes,
+            "tx_bytes": stats.tx_bytes,
+            "rx_formatted": format_bytes(stats.rx_bytes),
+            "tx_formatted": format_bytes(stats.tx_bytes)
         })
-    return result
+    return ORJSONResponse(result)
 
 
 @app.get("/api/peers/{peer_id}")
-async def get_peer(peer_id: int, db: Session = Depends(get_db)):
-    peer = db.query(Peer).filter(Peer.id == peer_id).first()
+async def get_peer(peer_id: int, db: AsyncSession = Depends(get_db)):
+    peer = await db.get(Peer, peer_id)
     if not peer:
         raise HTTPException(status_code=404, detail="Peer not found")
     
     peer.last_used = datetime.utcnow()
     peer.usage_count += 1
-    db.commit()
+    if not peer.qr_png_b64 or peer.qr_box_size != QR_BOX_SIZE:
+        # Peers created before QR caching, or cached at another size
+        peer.qr_png_b64 = await asyncio.to_thread(generate_qr_code, peer.config_text)
+        peer.qr_box_size = QR_BOX_SIZE
+    await db.commit()
     
-    wg_stats = get_wireguard_stats()
-    stats = wg_stats.get(peer.public_key, {})
+    stats = WG_STATS_SNAPSHOT.get(peer.public_key, EMPTY_STAT)
     
-    return {
+    return ORJSONResponse({
         "id": peer.id,
         "name": peer.name,
         "ip_address": peer.ip_address,
-        "created_at": peer.created_at.isoformat(),
-        "last_used": peer.last_used.isoformat() if peer.last_used else None,
+        "created_at": peer.created_at,
+        "last_used": peer.last_used,
         "usage_count": peer.usage_count,
         "is_active": bool(peer.is_active),
-        "qr_code": generate_qr_code(peer.config_text),
+        "qr_code": peer.qr_png_b64,
         "config": peer.config_text,
-        "is_connected": stats.get('is_connected', False),
-        "last_handshake": stats.get('latest_handshake').isoformat() if stats.get('latest_handshake') else None,
-        "rx_bytes": stats.get('rx_bytes', 0),
-        "tx_bytes": stats.get('tx_bytes', 0),
-        "rx_formatted": format_bytes(stats.get('rx_bytes', 0)),
-        "tx_formatted": format_bytes(stats.get('tx_bytes', 0))
-    }
+        "is_connected": stats.is_connected,
+        "last_handshake": handshake_datetime(stats.latest_handshake_ts),
+        "rx_bytes": stats.rx_bytes,
+        "tx_bytes": stats.tx_bytes,
+        "rx_formatted": format_bytes(stats.rx_bytes),
+        "tx_formatted": format_bytes(stats.tx_bytes)
+    })
 
 
 @app.delete("/api/peers/{peer_id}")
-async def delete_peer(peer_id: int, db: Session = Depends(get_db)):
-    peer = db.query(Peer).filter(Peer.id == peer_id).first()
+async def delete_peer(peer_id: int, db: AsyncSession = Depends(get_db)):
+    peer = await db.get(Peer, peer_id)
     if not peer:
         raise HTTPException(status_code=404, detail="Peer not found")
     
-    remove_peer_from_wireguard(peer.public_key)
-    db.delete(peer)
-    db.commit()
+    # The wg update and the DB write are independent; run them side by side
+    await db.delete(peer)
+    await asyncio.gather(remove_peer_from_wireguard(peer.public_key), db.commit())
     
-    return {"message": "Peer deleted"}
+    return ORJSONResponse({"message": "Peer deleted"})
 
 
 @app.post("/api/peers/{peer_id}/toggle")
-async def toggle_peer(peer_id: int, db: Session = Depends(get_db)):
-    peer = db.query(Peer).filter(Peer.id == peer_id).first()
+async def toggle_peer(peer_id: int, db: AsyncSession = Depends(get_db)):
+    peer = await db.get(Peer, peer_id)
     if not peer:
         raise HTTPException(status_code=404, detail="Peer not found")
     
     if peer.is_active:
-        remove_peer_from_wireguard(peer.public_key)
+        wg_update = remove_peer_from_wireguard(peer.public_key)
         peer.is_active = 0
     else:
-        add_peer_to_wireguard(peer.public_key, peer.ip_address, peer.preshared_key)
+        wg_update = add_peer_to_wireguard(peer.public_key, peer.ip_address, peer.preshared_key)
         peer.is_active = 1
     
-    db.commit()
-    return {"is_active": bool(peer.is_active)}
+    await asyncio.gather(wg_update, db.commit())
+    return ORJSONResponse({"is_active": bool(peer.is_active)})
 
 
 @app.get("/api/stats")
-async def get_stats(db: Session = Depends(get_db)):
+async def get_stats(db: AsyncSession = Depends(get_db)):
     """Get live WireGuard stats"""
-    peers = db.query(Peer).all()
-    wg_stats = get_wireguard_stats()
+    wg_stats = WG_STATS_SNAPSHOT
+    connected_keys = [public_key for public_key, stats in wg_stats.items() if stats.is_connected]
+    
+    total_peers, enabled_peers, total_scans = (await db.execute(
+        select(func.count(Peer.id), func.sum(Peer.is_active), func.sum(Peer.usage_count))
+    )).one()
+    # Only the rows of connected peers are needed, not the whole table
+    peers = (await db.execute(
+        select(Peer.id, Peer.name, Peer.ip_address, Peer.public_key)
+        .where(Peer.public_key.in_(connected_keys))
+        .order_by(Peer.id)
+    )).all() if connected_keys else []
     
+    now_ts = time.time()
     connected = []
     for peer in peers:
-        stats = wg_stats.get(peer.public_key, {})
-        if stats.get('is_connected'):
-            connected.append({
-                'id': peer.id,
-                'name': peer.name,
-                'ip_address': peer.ip_address,
-                'rx_formatted': format_bytes(stats.get('rx_bytes', 0)),
-                'tx_formatted': format_bytes(stats.get('tx_bytes', 0)),
-                'last_handshake_ago': time_ago(stats.get('latest_handshake'))
-            })
+        stats = wg_stats[peer.public_key]
+        connected.append({
+            'id': peer.id,
+            'name': peer.name,
+            'ip_address': peer.ip_address,
+            'rx_formatted': format_bytes(stats.rx_bytes),
+            'tx_formatted': format_bytes(stats.tx_bytes),
+            'last_handshake_ago': time_ago(stats.latest_handshake_ts, now_ts)
+        })
     
-    return {
+    return ORJSONResponse({
         'connected_count': len(connected),
         'connected_peers': connected,
-        'total_peers': len(peers)
-    }
+        'total_peers': total_peers,
+        'enabled_peers': enabled_peers or 0,
+        'total_scans': total_scans or 0
+    })
 
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+    return ORJSONResponse({"status": "healthy", "timestamp": datetime.utcnow()})
 
 
 if __name__ == "__main__":